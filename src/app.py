@@ -1,19 +1,33 @@
+import functools
 import gradio as gr
+from concurrent.futures import ThreadPoolExecutor
 
 from constants import BANNER_TEXT, EXAMPLES
-from generate_podcast import generate_podcast_script
-from step_tts import podcast_tts
+from generate_podcast import stream_podcast_script
+from step_tts import get_tts_engine, podcast_tts
 from utils import get_models
 from voice_ui import create_voice_tab
-from voice_manager import VoiceManager
+from voice_manager import get_voice_manager
 
-MODELS = get_models()
-voice_manager = VoiceManager()
+voice_manager = get_voice_manager()
 
 def get_voice_choices():
     """Get list of available voices for dropdowns."""
-    voices = voice_manager.get_available_voices()
-    return [{"value": v["id"], "label": f"{v['name']} ({v['type']})"} for v in voices]
+    return [(v["label"], v["id"]) for v in voice_manager.get_available_voices()]
+
+# Query Ollama, read the voice library and load the TTS model in parallel at startup,
+# so the first request doesn't pay for the model load
+with ThreadPoolExecutor(max_workers=3) as executor:
+    models_future = executor.submit(get_models)
+    voices_future = executor.submit(get_voice_choices)
+    tts_future = executor.submit(get_tts_engine)
+    MODELS = models_future.result()
+    voice_choices = voices_future.result()
+    try:
+        tts_future.result()
+    except Exception as e:
+        # Keep script generation available; get_tts_engine() retries the load on the first TTS request
+        print(f"Error preloading TTS model: {str(e)}")
 
 # Main application
 with gr.Blocks() as demo:
@@ -35,9 +49,6 @@ with gr.Blocks() as demo:
                         host_a = gr.Textbox(label="Host 1 Name", value="Lily")
                         host_b = gr.Textbox(label="Host 2 Name", value="Marshall")
                     with gr.Row():
-                        # Get voice choices
-                        voice_choices = get_voice_choices()
-                        
                         # Create voice dropdowns with allow_custom_value=True to prevent warnings
                         voice_a = gr.Dropdown(
                             choices=voice_choices,
@@ -71,6 +82,7 @@ with gr.Blocks() as demo:
                         )
                     with gr.Row():
                         generate_btn = gr.Button("Generate", variant="primary")
+                        regenerate_btn = gr.Button("Regenerate (bypass cache)", variant="secondary")
                 
                 # TTS column
                 with gr.Column(variant="panel"):
@@ -85,7 +97,7 @@ with gr.Blocks() as demo:
                     with gr.Row():
                         tts_btn = gr.Button("Generate", variant="primary")
                     with gr.Row():
-                        out_audio = gr.Audio(label="Output Audio", interactive=False, streaming=False, autoplay=True)
+                        out_audio = gr.Audio(label="Output Audio", interactive=False, streaming=True, autoplay=True)
                     with gr.Accordion("Output Tokens", open=False):
                         out_ps = gr.Textbox(interactive=False, show_label=False, info="Tokens used to generate the audio.", lines=15)
 
@@ -100,7 +112,13 @@ with gr.Blocks() as demo:
             )
             
             generate_btn.click(
-                fn=generate_podcast_script,
+                fn=stream_podcast_script,
+                inputs=[topic, model, host_a, host_b],
+                outputs=[script]
+            )
+            
+            regenerate_btn.click(
+                fn=functools.partial(stream_podcast_script, bypass=True),
                 inputs=[topic, model, host_a, host_b],
                 outputs=[script]
             )
@@ -114,10 +132,18 @@ with gr.Blocks() as demo:
             tts_btn.click(
                 fn=podcast_tts,
                 inputs=[script, host_voices],
-                outputs=[out_audio, out_ps]
+                outputs=[out_audio, out_ps],
+                show_progress="hidden"
             )
         
         # Voice Management Tab
         voice_tab, _ = create_voice_tab()
+    
+    def refresh_models():
+        """Refresh the model choices, so models pulled into Ollama after startup show up."""
+        return gr.update(choices=get_models())
+    
+    # Re-read the model list on each page load; get_models() reuses it for a minute
+    demo.load(fn=refresh_models, outputs=[model])
 
 demo.launch(server_name="0.0.0.0", server_port=52881)
@@ -1,5 +1,12 @@
 import json
 import requests
+from typing import Iterator
+
+from llm_cache import llm_cache
+
+# Shared session so connections to Ollama are kept alive between requests
+_SESSION = requests.Session()
+_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 SYSTEM_PROMPT = """
 You are a helpful assistant. The user will provide you with a topic to write a podcast about. You should write an informative podcast (a la NPR) based on the topic. The podcast should cover all the topics and key points the user requests.
@@ -17,30 +24,87 @@ Example format:
 """
 
 
-def generate_podcast_script(prompt: str, model: str, host_a: str, host_b: str) -> str:
-    """Generate a podcast script from a given prompt."""
+def _build_request(prompt: str, model: str, host_a: str, host_b: str, stream: bool) -> dict:
+    """Build the Ollama generate request for a podcast script."""
     # Construct the messages
     system_prompt = SYSTEM_PROMPT.format(host_a=host_a.title(), host_b=host_b.title())
     
+    return {
+        "model": model,
+        "prompt": f"{system_prompt}\n\nTopic: {prompt}",
+        "stream": stream,
+        "options": {
+            "temperature": 0.7,
+            "top_p": 0.9,
+        }
+    }
+
+
+def generate_podcast_script(prompt: str, model: str, host_a: str, host_b: str, bypass: bool = False) -> str:
+    """Generate a podcast script from a given prompt."""
+    # Reuse the first script generated for the same inputs unless bypassing the cache
+    cache_key = llm_cache.make_key(model, host_a, host_b, prompt)
+    if not bypass:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
     # Make request to Ollama API
-    response = requests.post(
+    response = _SESSION.post(
         "http://localhost:11434/api/generate",
-        json={
-            "model": model,
-            "prompt": f"{system_prompt}\n\nTopic: {prompt}",
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "top_p": 0.9,
-            }
-        }
+        json=_build_request(prompt, model, host_a, host_b, stream=False),
+        timeout=(5, 300)
     )
     
     if response.status_code != 200:
         return "Error: Failed to generate podcast script. Please try again."
     
     # Extract the generated text
-    return response.json()["response"]
+    script = response.json()["response"]
+    if script.strip():
+        llm_cache.set(cache_key, script)
+    return script
+
+
+def stream_podcast_script(prompt: str, model: str, host_a: str, host_b: str, bypass: bool = False) -> Iterator[str]:
+    """Generate a podcast script from a given prompt, yielding the script so far as it is generated."""
+    # Reuse the first script generated for the same inputs unless bypassing the cache
+    cache_key = llm_cache.make_key(model, host_a, host_b, prompt)
+    if not bypass:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    # Make streaming request to Ollama API
+    response = _SESSION.post(
+        "http://localhost:11434/api/generate",
+        json=_build_request(prompt, model, host_a, host_b, stream=True),
+        timeout=(5, 300),
+        stream=True
+    )
+    
+    if response.status_code != 200:
+        yield "Error: Failed to generate podcast script. Please try again."
+        return
+    
+    # Ollama streams one JSON object per line, each holding the next piece of text
+    script = ""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if "error" in chunk:
+            yield f"Error: {chunk['error']}"
+            return
+        script += chunk.get("response", "")
+        yield script
+        
+        # Only a reply Ollama marked as finished is cached, so a cut-off or empty script is regenerated next time
+        if chunk.get("done"):
+            if script.strip():
+                llm_cache.set(cache_key, script)
+            return
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+class LLMCache:
+    """Exact-match cache of LLM responses, stored as one JSON file per key."""
+
+    def __init__(self, cache_dir: str = "/workspace/llm_cache", expire: int = 86400):
+        """Store entries under cache_dir, each kept for expire seconds."""
+        self.cache_dir = Path(cache_dir)
+        self.expire = expire
+
+    @staticmethod
+    def make_key(model: str, host_a: str, host_b: str, prompt: str) -> str:
+        """Hash the inputs of a script generation into a cache key."""
+        payload = json.dumps([model, host_a, host_b, prompt], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None if missing or expired."""
+        entry_path = self.cache_dir / f"{key}.json"
+        try:
+            with open(entry_path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry["expires"] < time.time():
+            entry_path.unlink(missing_ok=True)
+            return None
+        return entry["response"]
+
+    def set(self, key: str, response: str):
+        """Cache a response until it expires."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            entry_path = self.cache_dir / f"{key}.json"
+
+            # Write to a temporary file first so readers never see a partial entry
+            tmp_path = entry_path.with_suffix(".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({"expires": time.time() + self.expire, "response": response}, f)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            print(f"Error caching LLM response: {str(e)}")
+
+llm_cache = LLMCache()
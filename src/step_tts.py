@@ -1,9 +1,26 @@
+import os
 import re
+import asyncio
 import torch
+import threading
 import numpy as np
 import torchaudio
+from collections import OrderedDict
 from transformers import AutoProcessor, AutoModel
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
+
+from tts_backends import create_backend
+from utils import get_resampler
+
+# Turns sharing a voice are synthesized together in batches of up to this size
+TTS_BATCH_SIZE = 16
+# Maximum relative text length difference between turns in the same batch
+TTS_BATCH_LENGTH_TOLERANCE = 0.2
+# Number of voice embeddings kept in memory
+VOICE_EMBEDDING_CACHE_SIZE = 64
+
+# Dialogue turns formatted as "<|speaker|>: content", each ending at a blank line
+_TURN_RE = re.compile(r"<\|([^|]+)\|>:[ \t]*([^\0]*?)(?=\n\n|\Z)", re.DOTALL)
 
 class StepTTS:
     def __init__(self):
@@ -11,6 +28,16 @@ class StepTTS:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
             print(f"Using device: {self.device}")
             
+            # Run in half precision on GPU, preferring bf16 where supported
+            if self.device == "cuda":
+                self.dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            else:
+                self.dtype = torch.float32
+            
+            # Voice embeddings keyed by reference audio path and modification time, oldest first
+            self._voice_embeddings: "OrderedDict[Tuple[str, int], torch.Tensor]" = OrderedDict()
+            self._voice_embeddings_lock = threading.Lock()
+            
             print("Loading TTS processor...")
             self.processor = AutoProcessor.from_pretrained(
                 "stepfun-ai/Step-Audio-TTS-3B",
@@ -22,10 +49,15 @@ class StepTTS:
             self.model = AutoModel.from_pretrained(
                 "stepfun-ai/Step-Audio-TTS-3B",
                 trust_remote_code=True,
-                cache_dir="/workspace/models"
+                cache_dir="/workspace/models",
+                torch_dtype=self.dtype
             ).to(self.device)
             
             self.model.eval()
+            
+            # Backend that runs generation, selected with PTT_TTS_BACKEND
+            self.backend = create_backend(self.processor, self.model, self.device, self.dtype)
+            
             print("TTS model loaded successfully!")
             
         except Exception as e:
@@ -44,12 +76,17 @@ class StepTTS:
             
             # Resample to model's sample rate if needed
             if sample_rate != 24000:
-                resampler = torchaudio.transforms.Resample(sample_rate, 24000)
+                resampler = get_resampler(sample_rate, 24000)
                 waveform = resampler(waveform)
             
+            # Narrow to the model's half precision and pin on the host so the GPU copy is asynchronous
+            if self.device == "cuda":
+                waveform = waveform.to(self.dtype).pin_memory()
+            waveform = waveform.to(self.device, dtype=self.dtype, non_blocking=True)
+            
             # Extract voice embedding
-            with torch.no_grad():
-                voice_embedding = self.model.extract_voice_embedding(waveform.to(self.device))
+            with torch.inference_mode():
+                voice_embedding = self.model.extract_voice_embedding(waveform)
             
             return voice_embedding
             
@@ -57,69 +94,170 @@ class StepTTS:
             print(f"Error loading reference audio: {str(e)}")
             return None
 
-    def tts(self, text: str, reference_audio: Optional[str] = None, speed: float = 1.0):
-        """Convert text to speech using Step-Audio-TTS-3B with optional voice cloning."""
+    def _load_voice_embedding(self, audio_path: str, mtime_ns: int) -> Optional[torch.Tensor]:
+        """Load a voice embedding from its sidecar file, extracting and saving it on a miss."""
+        embedding_path = audio_path + ".emb.pt"
+        
+        # Reuse the sidecar file unless the reference audio is newer
+        if os.path.exists(embedding_path) and os.stat(embedding_path).st_mtime_ns >= mtime_ns:
+            try:
+                return torch.load(embedding_path, map_location=self.device)
+            except Exception as e:
+                print(f"Error loading cached voice embedding: {str(e)}")
+        
+        voice_embedding = self._load_reference_audio(audio_path)
+        if voice_embedding is not None:
+            try:
+                torch.save(voice_embedding.cpu(), embedding_path)
+            except Exception as e:
+                print(f"Error caching voice embedding: {str(e)}")
+        
+        return voice_embedding
+
+    def get_voice_embedding(self, audio_path: str) -> Optional[torch.Tensor]:
+        """Get the voice embedding for a reference audio file, computing it only once."""
+        try:
+            # Key on modification time so a re-created voice isn't served a stale embedding
+            mtime_ns = os.stat(audio_path).st_mtime_ns
+        except OSError as e:
+            print(f"Error loading reference audio: {str(e)}")
+            return None
+        
+        key = (audio_path, mtime_ns)
+        with self._voice_embeddings_lock:
+            voice_embedding = self._voice_embeddings.get(key)
+            if voice_embedding is not None:
+                self._voice_embeddings.move_to_end(key)
+                return voice_embedding
+        
+        # Failures aren't cached, so a transient error such as an OOM is retried on the next request
+        voice_embedding = self._load_voice_embedding(audio_path, mtime_ns)
+        if voice_embedding is not None:
+            with self._voice_embeddings_lock:
+                self._voice_embeddings[key] = voice_embedding
+                if len(self._voice_embeddings) > VOICE_EMBEDDING_CACHE_SIZE:
+                    self._voice_embeddings.popitem(last=False)
+        return voice_embedding
+
+    def _adjust_speed(self, audio: torch.Tensor, speed: float) -> np.ndarray:
+        """Change the playback speed of generated audio and move it to the CPU."""
+        # Audio output is always float32, whatever precision the model ran in
+        audio = audio.float()
+        if speed != 1.0:
+            # Polyphase resampling on the model's device, playing back at 24kHz
+            audio = torchaudio.functional.resample(audio, int(round(24000 * speed)), 24000)
+        return audio.cpu().numpy()
+
+    def tts_batch(
+        self,
+        texts: List[str],
+        voice_embeddings: List[Optional[torch.Tensor]],
+        speed: float = 1.0
+    ) -> List[Tuple[int, np.ndarray]]:
+        """Convert a batch of texts to speech in a single backend call."""
         try:
             # Preprocess text
-            text = text.strip()
-            if not text:
+            texts = [text.strip() for text in texts]
+            if not texts or not all(texts):
                 raise ValueError("Empty text provided")
             
-            # Load reference audio if provided
-            voice_embedding = None
-            if reference_audio:
-                voice_embedding = self._load_reference_audio(reference_audio)
+            # Stack voice embeddings into a (B, D) tensor if available
+            embeddings = None
+            if any(emb is not None for emb in voice_embeddings):
+                if any(emb is None for emb in voice_embeddings):
+                    raise ValueError("Voice embeddings must be provided for every text in the batch")
+                embeddings = torch.stack(
+                    [emb.reshape(-1) for emb in voice_embeddings]
+                ).to(self.device, dtype=self.dtype)
             
-            # Generate audio
-            inputs = self.processor(text=text, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            batch_audio = self.backend.generate_batch(texts, embeddings)
             
-            # Add voice embedding if available
-            if voice_embedding is not None:
-                inputs["voice_embedding"] = voice_embedding
-            
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    do_sample=True,
-                    temperature=0.7,
-                    max_length=1000
-                )
-            
-            # Get audio data from model output
-            audio = outputs.audio[0].cpu().numpy()
-            
-            # Apply speed adjustment if needed
-            if speed != 1.0:
-                # Simple resampling for speed adjustment
-                target_length = int(len(audio) / speed)
-                audio = np.interp(
-                    np.linspace(0, len(audio), target_length),
-                    np.arange(len(audio)),
-                    audio
-                )
-            
-            return (24000, audio)  # Return sample rate and audio data
+            # Sample rate and audio data for each text
+            return [(24000, self._adjust_speed(audio, speed)) for audio in batch_audio]
             
         except Exception as e:
+            # Raise rather than returning silence, so a failing backend is reported instead of producing a silent podcast
             print(f"Error generating speech: {str(e)}")
-            # Return 1 second of silence as fallback
-            return (24000, np.zeros(24000))
+            raise
+
+    def tts(self, text: str, reference_audio: Optional[str] = None, speed: float = 1.0):
+        """Convert text to speech using Step-Audio-TTS-3B with optional voice cloning."""
+        # Load reference audio if provided
+        voice_embedding = None
+        if reference_audio:
+            voice_embedding = self.get_voice_embedding(reference_audio)
+        
+        return self.tts_batch([text], [voice_embedding], speed=speed)[0]
+
+# Shared TTS engine so model weights stay resident across requests
+_TTS_SINGLETON: Optional[StepTTS] = None
+_TTS_LOCK = threading.Lock()
+
+def get_tts_engine() -> StepTTS:
+    """Get the shared TTS engine, loading the model on first use."""
+    global _TTS_SINGLETON
+    if _TTS_SINGLETON is None:
+        with _TTS_LOCK:
+            # Re-check under the lock so concurrent requests only load once
+            if _TTS_SINGLETON is None:
+                _TTS_SINGLETON = StepTTS()
+    return _TTS_SINGLETON
 
-from voice_manager import VoiceManager
+from voice_manager import get_voice_manager
 
-def podcast_tts(text: str, host_voices: dict[str, str]):
-    """Convert podcast script text to speech."""
+def _parse_turns(text: str) -> List[Tuple[str, str]]:
+    """Parse a podcast script into (speaker, content) dialogue turns."""
+    return [(m.group(1), m.group(2).strip()) for m in _TURN_RE.finditer(text.strip())]
+
+def _batch_turns(turns: List[Tuple[str, str]], host_voices: Dict[str, str]) -> List[Tuple[str, List[int]]]:
+    """Group turn indices into batches sharing a voice and of similar text length."""
+    turns_by_voice: Dict[str, List[int]] = {}
+    for i, (speaker, _) in enumerate(turns):
+        turns_by_voice.setdefault(host_voices[speaker], []).append(i)
+    
+    batches = []
+    for voice_id, indices in turns_by_voice.items():
+        # Sort by length so each batch pads as little as possible
+        indices.sort(key=lambda i: len(turns[i][1]))
+        batch = []
+        for i in indices:
+            max_length = len(turns[batch[0]][1]) * (1 + TTS_BATCH_LENGTH_TOLERANCE) if batch else 0
+            if batch and (len(batch) >= TTS_BATCH_SIZE or len(turns[i][1]) > max_length):
+                batches.append((voice_id, batch))
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append((voice_id, batch))
+    
+    # Order batches by their earliest turn so audio can be streamed in script order
+    batches.sort(key=lambda batch: min(batch[1]))
+    return batches
+
+async def _resolve_voice_embeddings(tts_engine: StepTTS, voice_ids: Set[str]) -> Dict[str, Optional[torch.Tensor]]:
+    """Get the embedding of each voice, or None for voices without reference audio."""
+    loop = asyncio.get_running_loop()
+    voice_manager = get_voice_manager()
+    voice_embeddings = {}
+    for voice_id in voice_ids:
+        reference_audio = voice_manager.get_voice_path(voice_id)
+        if reference_audio:
+            voice_embeddings[voice_id] = await loop.run_in_executor(None, tts_engine.get_voice_embedding, reference_audio)
+        else:
+            voice_embeddings[voice_id] = None
+    return voice_embeddings
+
+async def podcast_tts(text: str, host_voices: dict[str, str]):
+    """Convert podcast script text to speech, streaming audio turn by turn."""
     try:
-        # Initialize TTS engine and voice manager
+        loop = asyncio.get_running_loop()
+        
+        # Initialize TTS engine
         print("Initializing TTS engine...")
-        tts_engine = StepTTS()
-        voice_manager = VoiceManager()
+        tts_engine = get_tts_engine()
         
         # Parse script
         print("Parsing podcast script...")
-        pattern = r"<\|(.*?)\|>: (.*?)(?:\n\n|$)"
-        turns = re.findall(pattern=pattern, string=text.strip())
+        turns = _parse_turns(text)
         
         if not turns:
             raise ValueError("No valid dialogue turns found in the script")
@@ -129,41 +267,52 @@ def podcast_tts(text: str, host_voices: dict[str, str]):
             non_matching_hosts = [speaker for speaker, _ in turns if speaker not in host_voices]
             raise ValueError(f"Invalid speaker(s): {set(non_matching_hosts)}")
         
-        # Process each turn
-        print(f"Processing {len(turns)} dialogue turns...")
-        audio_segments = []
+        # Resolve each voice's embedding once, rather than per turn
+        voice_embeddings = await _resolve_voice_embeddings(tts_engine, {host_voices[speaker] for speaker, _ in turns})
+        
+        # Generate speech in batches of turns sharing a voice
+        batches = _batch_turns(turns, host_voices)
+        print(f"Processing {len(turns)} dialogue turns in {len(batches)} batches...")
+        pending_audio: Dict[int, np.ndarray] = {}
+        next_turn = 0
         tokens = []
+        pause_length = int(24000 * 0.5)  # 0.5 second pause
         
-        for i, (speaker, content) in enumerate(turns, 1):
-            print(f"Processing turn {i}/{len(turns)} for {speaker}...")
-            
-            # Get voice reference audio if available
-            voice_id = host_voices[speaker]
-            reference_audio = voice_manager.get_voice_path(voice_id)
-            
-            # Generate speech
-            turn_audio = tts_engine.tts(
-                text=content,
-                reference_audio=reference_audio,
+        def synthesize_batch(voice_id: str, indices: List[int]) -> List[Tuple[int, np.ndarray]]:
+            """Generate speech for one batch of turns."""
+            print(f"Processing {len(indices)} turns for voice {voice_id}...")
+            return tts_engine.tts_batch(
+                texts=[turns[j][1] for j in indices],
+                voice_embeddings=[voice_embeddings[voice_id]] * len(indices),
                 speed=1.0
             )
-            audio_segments.append(turn_audio[1])
-            tokens.append(f"{content}\n{speaker}")
-            
-            # Add a short pause between turns
-            pause_length = int(24000 * 0.5)  # 0.5 second pause
-            audio_segments.append(np.zeros(pause_length))
         
-        # Concatenate all audio segments
-        print("Combining audio segments...")
-        audio = np.concatenate(audio_segments)
-        audio_tokens = "\n\n".join(tokens)
+        # Keep the next batch generating on the GPU while the current one is streamed
+        next_batch = loop.run_in_executor(None, synthesize_batch, *batches[0])
+        for i, (voice_id, indices) in enumerate(batches, 1):
+            batch_audio = await next_batch
+            if i < len(batches):
+                next_batch = loop.run_in_executor(None, synthesize_batch, *batches[i])
+            print(f"Finished batch {i}/{len(batches)}")
+            
+            for j, (_, audio) in zip(indices, batch_audio):
+                pending_audio[j] = audio
+            
+            # Stream every turn that is ready in script order, each followed by a short pause
+            while next_turn in pending_audio:
+                speaker, content = turns[next_turn]
+                # Copy the turn into a zeroed buffer; the pause is the untouched tail
+                turn_audio = pending_audio.pop(next_turn)
+                audio = np.zeros(len(turn_audio) + pause_length, dtype=np.float32)
+                audio[:len(turn_audio)] = turn_audio
+                tokens.append(f"{content}\n{speaker}")
+                next_turn += 1
+                yield (24000, audio), "\n\n".join(tokens)
         
         print("Audio generation complete!")
-        return (24000, audio), audio_tokens
         
     except Exception as e:
         error_msg = f"Error generating podcast audio: {str(e)}"
         print(error_msg)
         # Return 3 seconds of silence and error message
-        return (24000, np.zeros(24000 * 3)), error_msg
\ No newline at end of file
+        yield (24000, np.zeros(24000 * 3)), error_msg
\ No newline at end of file
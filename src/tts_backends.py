@@ -0,0 +1,261 @@
+import os
+import inspect
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList
+from typing import Dict, List, Optional, Protocol
+
+# Input lengths are padded up to one of these so compiled graphs can be reused
+TTS_INPUT_BUCKETS = (64, 128, 256, 512)
+# Longest sequence (prompt plus speech tokens) generated, which is also the size of the static KV cache
+TTS_MAX_LENGTH = 1000
+# Speech tokens are vocoded in chunks of this many tokens (about 0.6s of audio)
+VOCODER_CHUNK_TOKENS = 50
+# Each chunk is also given this many of the previous chunk's tokens and cross-faded over their audio, so chunk
+# boundaries don't click
+VOCODER_OVERLAP_TOKENS = 8
+
+class StepTTSBackend(Protocol):
+    """Generates speech for a batch of texts with Step-Audio-TTS-3B."""
+
+    def generate_batch(self, texts: List[str], embeddings: Optional[torch.Tensor]) -> List[torch.Tensor]:
+        """Generate one 1-D audio tensor per text, conditioned on (B, D) voice embeddings if given."""
+        ...
+
+def _crossfade(audio: torch.Tensor, next_audio: torch.Tensor, overlap: int) -> torch.Tensor:
+    """Append next_audio to audio, fading linearly between the overlap samples at the end of one and the start of the other."""
+    overlap = min(overlap, audio.shape[0], next_audio.shape[0])
+    if overlap == 0:
+        return torch.cat([audio, next_audio])
+    fade = torch.linspace(0, 1, overlap, dtype=audio.dtype, device=audio.device)
+    blended = audio[-overlap:] * (1 - fade) + next_audio[:overlap] * fade
+    return torch.cat([audio[:-overlap], blended, next_audio[overlap:]])
+
+class _ChunkVocoder(LogitsProcessor):
+    """Vocodes speech tokens in chunks while generate() is still producing them, on a side CUDA stream if given."""
+
+    def __init__(self, model, prompt_length: int, embeddings: Optional[torch.Tensor], pad_token_id: Optional[int],
+                 vocoder_stream: Optional[torch.cuda.Stream] = None):
+        """Vocode the tokens generated after the first prompt_length positions of input_ids."""
+        self.model = model
+        self.prompt_length = prompt_length
+        self.vocoded_length = prompt_length
+        self.embeddings = embeddings
+        self.pad_token_id = pad_token_id
+        self.vocoder_stream = vocoder_stream
+        self.chunks = []
+
+    def __call__(self, input_ids: torch.Tensor, scores: torch.Tensor) -> torch.Tensor:
+        """Vocode the next chunk once enough new tokens exist, leaving the scores untouched."""
+        # Logits processors see every token so far on the model's device (unlike streamers, which get
+        # host copies), so chunks are vocoded without a device-to-host transfer. finish() picks up the rest
+        if input_ids.shape[1] - self.vocoded_length >= VOCODER_CHUNK_TOKENS:
+            self._vocode(input_ids, self.vocoded_length + VOCODER_CHUNK_TOKENS)
+        return scores
+
+    def _run_vocoder(self, tokens: torch.Tensor) -> torch.Tensor:
+        """Decode (B, T) speech tokens into (B, samples) audio."""
+        if self.embeddings is not None:
+            return self.model.vocoder(tokens, voice_embedding=self.embeddings)
+        return self.model.vocoder(tokens)
+
+    def _vocode(self, input_ids: torch.Tensor, end: int):
+        """Vocode the tokens up to end, queuing them on the vocoder stream and copying their audio to pinned host memory if there is one."""
+        start = self.vocoded_length
+        self.vocoded_length = end
+        overlap = min(VOCODER_OVERLAP_TOKENS, start - self.prompt_length)
+        tokens = input_ids[:, start - overlap:end]
+
+        # Rows that finished early are padded, so count each row's real new tokens (on device, without syncing)
+        valid = None
+        if self.pad_token_id is not None:
+            valid = (input_ids[:, start:end] != self.pad_token_id).sum(dim=1)
+
+        if self.vocoder_stream is None:
+            self.chunks.append((self._run_vocoder(tokens), None, overlap, end - start, valid))
+            return
+
+        # Let the vocoder start once the tokens exist, without blocking the decode loop
+        tokens_ready = torch.cuda.Event()
+        tokens_ready.record()
+        with torch.cuda.stream(self.vocoder_stream):
+            self.vocoder_stream.wait_event(tokens_ready)
+            # input_ids is reallocated every step, so keep this slice's memory alive until the vocoder has read it
+            tokens.record_stream(self.vocoder_stream)
+            if valid is not None:
+                valid.record_stream(self.vocoder_stream)
+            audio = self._run_vocoder(tokens)
+            host_audio = torch.empty(audio.shape, dtype=audio.dtype, pin_memory=True)
+            host_audio.copy_(audio, non_blocking=True)
+            audio_ready = torch.cuda.Event()
+            audio_ready.record(self.vocoder_stream)
+
+        self.chunks.append((host_audio, audio_ready, overlap, end - start, valid))
+
+    def finish(self, sequences: torch.Tensor) -> List[torch.Tensor]:
+        """Vocode the tokens left after the last full chunk, then join the chunks into one audio tensor per row."""
+        if sequences.shape[1] > self.vocoded_length:
+            self._vocode(sequences, sequences.shape[1])
+        if not self.chunks:
+            raise ValueError("No speech tokens were generated")
+        for _, audio_ready, _, _, _ in self.chunks:
+            if audio_ready is not None:
+                audio_ready.synchronize()
+
+        valid_tokens = [valid.tolist() if valid is not None else None for *_, valid in self.chunks]
+        rows = []
+        for i in range(sequences.shape[0]):
+            row = self.chunks[0][0].new_zeros(0)
+            for (chunk_audio, _, overlap, num_tokens, _), valid in zip(self.chunks, valid_tokens):
+                # Chunks after a row finished hold only padding
+                row_tokens = valid[i] if valid is not None else num_tokens
+                if row_tokens == 0:
+                    break
+                # Use each chunk's own sample count rather than assuming the vocoder's output is the same length per token
+                samples_per_token = chunk_audio.shape[1] / (overlap + num_tokens)
+                audio = chunk_audio[i, :round((overlap + row_tokens) * samples_per_token)]
+                row = _crossfade(row, audio, round(overlap * samples_per_token))
+            rows.append(row)
+        return rows
+
+class HFBackend:
+    """Generates speech with the HuggingFace transformers generate loop."""
+
+    def __init__(self, processor, model, device: str, dtype: torch.dtype):
+        """Set up generation for a loaded model, compiling its forward pass on GPU."""
+        self.processor = processor
+        self.model = model
+        self.device = device
+        self.dtype = dtype
+
+        # Generation continues from the end of each row, so batched prompts must be padded on the left
+        self.tokenizer = getattr(processor, "tokenizer", processor)
+        self.tokenizer.padding_side = "left"
+
+        # Compile the forward pass into CUDA graphs; generate() keeps driving the decode loop.
+        # Graphs are captured lazily, once per (batch size, input bucket) shape the first time it is used
+        self.compiled = self.device == "cuda"
+        if self.compiled:
+            print("Compiling TTS model...")
+            self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+
+        # Vocode on a side stream so it overlaps with token generation on the default stream. Models without a
+        # separate vocoder only return finished audio from generate(), so they keep the non-streaming path
+        self.vocoder_stream = None
+        if self.device == "cuda" and hasattr(self.model, "vocoder"):
+            self.vocoder_stream = torch.cuda.Stream()
+        # Skip generate()'s own vocoding when chunks are vocoded during generation, if the model allows it
+        self.skip_generate_audio = "return_audio" in inspect.signature(self.model.generate).parameters
+
+    def _pad_to_bucket(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """Left-pad input_ids and attention_mask to the next bucket length."""
+        seq_len = inputs["input_ids"].shape[1]
+        length = next((bucket for bucket in TTS_INPUT_BUCKETS if bucket >= seq_len), seq_len)
+        if length <= seq_len:
+            return inputs
+
+        # Pad on the left like the tokenizer, so generation still continues from each prompt's last token
+        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        padding = (length - seq_len, 0)
+
+        inputs["input_ids"] = torch.nn.functional.pad(inputs["input_ids"], padding, value=pad_token_id)
+        if "attention_mask" in inputs:
+            inputs["attention_mask"] = torch.nn.functional.pad(inputs["attention_mask"], padding, value=0)
+        return inputs
+
+    def _generate(self, inputs: Dict[str, torch.Tensor], **kwargs):
+        """Run the model's generate loop on prepared inputs."""
+        # A fixed-size KV cache keeps every decode step the same shape, so the compiled CUDA graphs are replayed
+        # instead of re-recorded as the dynamic cache grows
+        if self.compiled:
+            kwargs["cache_implementation"] = "static"
+        with torch.inference_mode(), torch.autocast(device_type=self.device, dtype=self.dtype, enabled=self.device == "cuda"):
+            return self.model.generate(
+                **inputs,
+                do_sample=True,
+                temperature=0.7,
+                max_length=TTS_MAX_LENGTH,
+                num_beams=1,
+                **kwargs
+            )
+
+    def generate_batch(self, texts: List[str], embeddings: Optional[torch.Tensor]) -> List[torch.Tensor]:
+        """Generate speech for the whole batch with a single generate call."""
+        # Tokenize the whole batch into padded (B, T) input_ids and attention_mask
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        if self.compiled:
+            inputs = self._pad_to_bucket(inputs)
+
+        if embeddings is not None:
+            inputs["voice_embedding"] = embeddings
+
+        # On GPU, vocode chunks of tokens on the side stream as they are generated instead of after generate() returns
+        if self.vocoder_stream is not None:
+            vocoder = _ChunkVocoder(
+                self.model, inputs["input_ids"].shape[1], embeddings, self.tokenizer.pad_token_id, self.vocoder_stream
+            )
+            kwargs = {"return_audio": False} if self.skip_generate_audio else {}
+            outputs = self._generate(inputs, logits_processor=LogitsProcessorList([vocoder]), **kwargs)
+            return vocoder.finish(getattr(outputs, "sequences", outputs))
+
+        outputs = self._generate(inputs)
+
+        # Split the batched audio back into rows, dropping any padded tail
+        audio_lengths = getattr(outputs, "audio_lengths", None)
+        audio = []
+        for i in range(len(texts)):
+            row = outputs.audio[i]
+            if audio_lengths is not None:
+                row = row[:int(audio_lengths[i])]
+            audio.append(row)
+        return audio
+
+class VLLMBackend:
+    """Generates speech tokens with vLLM and decodes them with the model's vocoder."""
+
+    def __init__(self, processor, model, device: str, dtype: torch.dtype):
+        """Start a vLLM engine for token generation next to the already loaded model."""
+        # vLLM is optional and only needed when this backend is selected
+        from vllm import LLM, SamplingParams
+
+        self.processor = processor
+        self.model = model
+        self.device = device
+
+        print("Loading vLLM engine...")
+        self.llm = LLM(
+            model="stepfun-ai/Step-Audio-TTS-3B",
+            dtype=str(dtype).removeprefix("torch."),
+            max_num_seqs=16,
+            trust_remote_code=True,
+            download_dir="/workspace/models",
+            # Leave room for the transformers model, which still extracts voice embeddings and runs the vocoder
+            gpu_memory_utilization=0.6
+        )
+        self.sampling_params = SamplingParams(temperature=0.7, max_tokens=1000)
+
+    def generate_batch(self, texts: List[str], embeddings: Optional[torch.Tensor]) -> List[torch.Tensor]:
+        """Generate speech tokens for the batch with vLLM, then vocode each row."""
+        prompts = [{"prompt_token_ids": ids} for ids in self.processor(text=texts)["input_ids"]]
+        outputs = self.llm.generate(prompts, self.sampling_params, use_tqdm=False)
+
+        # The vocoder runs outside the LLM engine, conditioned on the voice embedding
+        audio = []
+        with torch.inference_mode():
+            for i, output in enumerate(outputs):
+                tokens = torch.tensor(output.outputs[0].token_ids, device=self.device).unsqueeze(0)
+                if embeddings is not None:
+                    audio.append(self.model.vocoder(tokens, voice_embedding=embeddings[i:i + 1])[0])
+                else:
+                    audio.append(self.model.vocoder(tokens)[0])
+        return audio
+
+def create_backend(processor, model, device: str, dtype: torch.dtype) -> StepTTSBackend:
+    """Create the TTS backend selected by the PTT_TTS_BACKEND environment variable."""
+    backend = os.environ.get("PTT_TTS_BACKEND", "hf").lower()
+    print(f"Using TTS backend: {backend}")
+    if backend == "vllm":
+        return VLLMBackend(processor, model, device, dtype)
+    if backend == "hf":
+        return HFBackend(processor, model, device, dtype)
+    raise ValueError(f"Unknown TTS backend: {backend}")
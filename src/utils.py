@@ -1,13 +1,35 @@
+import time
+import functools
 import requests
+import torchaudio
+
+# Shared session so connections to Ollama are kept alive between requests
+_SESSION = requests.Session()
+_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+# Seconds to reuse the model list before querying Ollama again
+MODELS_CACHE_TTL = 60
+_models_cache = {"models": None, "expires": 0.0}
 
 
 def get_models() -> list[str]:
     """Get a list of available models."""
+    if _models_cache["models"] is not None and time.monotonic() < _models_cache["expires"]:
+        return _models_cache["models"]
     try:
-        response = requests.get("http://localhost:11434/api/tags")
+        # Listing models is quick, so an unresponsive Ollama fails fast instead of holding up startup
+        response = _SESSION.get("http://localhost:11434/api/tags", timeout=(2, 5))
         if response.status_code == 200:
             models = sorted([model["name"] for model in response.json()["models"]])
+            _models_cache.update(models=models, expires=time.monotonic() + MODELS_CACHE_TTL)
             return models
         return ["qwen2.5:32b"]  # Default model if can't connect
     except:
         return ["qwen2.5:32b"]  # Default model if can't connect
+
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(src_sr: int, dst_sr: int = 24000, device: str = "cpu") -> torchaudio.transforms.Resample:
+    """Get a resampler between two sample rates, reusing its filter kernel across calls."""
+    return torchaudio.transforms.Resample(src_sr, dst_sr).to(device)
@@ -1,29 +1,46 @@
 import os
 import re
-import json
+import orjson
 import torch
 import datetime
+import threading
 import numpy as np
 import torchaudio
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from utils import get_resampler
 
 class VoiceManager:
+    # Parsed voices_info.json contents per path, with the file mtime they were read at
+    _CACHE: Dict[Path, Tuple[float, Dict]] = {}
+
     def __init__(self, voices_dir: str = "/workspace/voices"):
         self.voices_dir = Path(voices_dir)
         self.voices_dir.mkdir(parents=True, exist_ok=True)
         self.voices_info_path = self.voices_dir / "voices_info.json"
         self.voices_info = self._load_voices_info()
+        # Sorted voice list, rebuilt on the next read after a voice is added or deleted
+        self._voices_list: Optional[Tuple[Dict, ...]] = None
 
     def _load_voices_info(self) -> Dict:
         """Load voice information from JSON file."""
         if self.voices_info_path.exists():
-            with open(self.voices_info_path, 'r') as f:
-                return json.load(f)
+            # Skip re-parsing if the file hasn't changed since it was last read
+            mtime = self.voices_info_path.stat().st_mtime
+            cached = type(self)._CACHE.get(self.voices_info_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            
+            with open(self.voices_info_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            type(self)._CACHE[self.voices_info_path] = (mtime, data)
+            return data
         return {
             "voices": {
                 "default": {
                     "name": "Default Voice",
+                    "label": "Default Voice (default)",
                     "description": "Default TTS voice",
                     "type": "default"
                 }
@@ -32,119 +49,159 @@ class VoiceManager:
 
     def _save_voices_info(self):
         """Save voice information to JSON file."""
-        with open(self.voices_info_path, 'w') as f:
-            json.dump(self.voices_info, f, indent=2)
+        # Write to a temporary file and swap it in so readers never see a partial file
+        tmp_path = self.voices_info_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(self.voices_info, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.voices_info_path)
+        type(self)._CACHE[self.voices_info_path] = (self.voices_info_path.stat().st_mtime, self.voices_info)
+
+    def process_audio_file(self, file_path: str, voice_name: str) -> Iterator[Tuple]:
+        """Process an audio file for voice cloning, yielding progress events and then a final done event."""
+        # Events are ("progress", percent, status) tuples as processing advances, then a single
+        # ("done", success, message, voice_path) tuple, where voice_path is None on failure
+        
+        # Input validation
+        if not file_path or not os.path.exists(file_path):
+            yield ("done", False, "Audio file not found", None)
+            return
+        
+        yield from self._process_audio(
+            lambda: torchaudio.load(file_path),
+            voice_name,
+            os.path.basename(file_path)
+        )
 
-    def process_audio_file(self, file_path: str, voice_name: str) -> Tuple[bool, str, List[Tuple[int, str]]]:
-        """Process an audio file for voice cloning."""
-        progress_updates = []
+    def process_audio_array(self, sample_rate: int, audio: np.ndarray, voice_name: str) -> Iterator[Tuple]:
+        """Process a (samples,) or (samples, channels) array, as uploaded through Gradio, like process_audio_file."""
+        # Input validation
+        if audio is None or not sample_rate:
+            yield ("done", False, "No audio provided", None)
+            return
+        
+        yield from self._process_audio(
+            lambda: (self._array_to_waveform(audio), sample_rate),
+            voice_name,
+            "uploaded audio"
+        )
+
+    @staticmethod
+    def _array_to_waveform(audio: np.ndarray) -> torch.Tensor:
+        """Convert a (samples,) or (samples, channels) array to a float (channels, samples) waveform."""
+        # Copy to float32 so later in-place processing never touches the caller's array,
+        # scaling integer PCM to [-1, 1]
+        if np.issubdtype(audio.dtype, np.integer):
+            waveform = torch.from_numpy(audio.astype(np.float32) / (float(np.iinfo(audio.dtype).max) + 1))
+        else:
+            waveform = torch.from_numpy(audio.astype(np.float32))
+        
+        return waveform.unsqueeze(0) if waveform.dim() == 1 else waveform.T.contiguous()
+
+    def _process_audio(self, load_audio: Callable[[], Tuple[torch.Tensor, int]], voice_name: str, source_name: str) -> Iterator[Tuple]:
+        """Validate, clean up and save audio from load_audio as a new voice, yielding progress events."""
         try:
-            # Input validation
-            if not file_path or not os.path.exists(file_path):
-                return False, "Audio file not found", []
-            
             if not voice_name or not voice_name.strip():
-                return False, "Voice name cannot be empty", []
+                yield ("done", False, "Voice name cannot be empty", None)
+                return
             
             voice_name = voice_name.strip()
             if not re.match(r'^[a-zA-Z0-9_-]+$', voice_name):
-                return False, "Voice name can only contain letters, numbers, underscores, and hyphens", []
+                yield ("done", False, "Voice name can only contain letters, numbers, underscores, and hyphens", None)
+                return
             
             # Check if voice name already exists
             if voice_name in self.voices_info["voices"]:
-                return False, "Voice name already exists", []
+                yield ("done", False, "Voice name already exists", None)
+                return
             
-            # Load and validate audio file
-            progress_updates.append((5, "Validating audio file..."))
+            # Load and validate audio
+            yield ("progress", 5, "Validating audio file...")
             try:
-                waveform, sample_rate = torchaudio.load(file_path)
+                waveform, sample_rate = load_audio()
             except Exception as e:
-                return False, f"Failed to load audio file: {str(e)}", []
+                yield ("done", False, f"Failed to load audio file: {str(e)}", None)
+                return
             
             # Basic audio validation
             if waveform.dim() == 0 or waveform.numel() == 0:
-                return False, "Audio file is empty", []
+                yield ("done", False, "Audio file is empty", None)
+                return
             
             if torch.isnan(waveform).any() or torch.isinf(waveform).any():
-                return False, "Audio file contains invalid values", []
+                yield ("done", False, "Audio file contains invalid values", None)
+                return
             
             # Validate audio length
             duration = waveform.shape[1] / sample_rate
             if duration < 5:  # At least 5 seconds
-                return False, f"Audio too short ({duration:.1f}s). Please provide at least 5 seconds of audio.", []
+                yield ("done", False, f"Audio too short ({duration:.1f}s). Please provide at least 5 seconds of audio.", None)
+                return
             elif duration > 300:  # Max 5 minutes
-                return False, f"Audio too long ({duration:.1f}s). Please provide audio shorter than 5 minutes.", []
+                yield ("done", False, f"Audio too long ({duration:.1f}s). Please provide audio shorter than 5 minutes.", None)
+                return
             
-            progress_updates.append((10, f"Loaded {duration:.1f} seconds of audio"))
-            progress_updates.append((15, f"Sample rate: {sample_rate}Hz, Channels: {waveform.shape[0]}"))
+            yield ("progress", 10, f"Loaded {duration:.1f} seconds of audio")
+            yield ("progress", 15, f"Sample rate: {sample_rate}Hz, Channels: {waveform.shape[0]}")
             
             # Convert to mono if stereo
             if waveform.shape[0] > 1:
-                progress_updates.append((20, "Converting stereo to mono..."))
+                yield ("progress", 20, "Converting stereo to mono...")
                 waveform = torch.mean(waveform, dim=0, keepdim=True)
-                progress_updates.append((25, "Converted to mono successfully"))
-            
-            # Validate audio levels
-            max_amplitude = waveform.abs().max().item()
-            if max_amplitude < 0.01:
-                return False, "Audio level too low. Please provide louder audio.", []
-            elif max_amplitude > 1.0:
-                progress_updates.append((30, "Audio levels high, will normalize..."))
+                yield ("progress", 25, "Converted to mono successfully")
             
             # Resample to 24kHz if needed
             if sample_rate != 24000:
-                progress_updates.append((35, f"Resampling from {sample_rate}Hz to 24000Hz..."))
+                yield ("progress", 35, f"Resampling from {sample_rate}Hz to 24000Hz...")
                 try:
-                    resampler = torchaudio.transforms.Resample(sample_rate, 24000)
+                    resampler = get_resampler(sample_rate, 24000)
                     waveform = resampler(waveform)
-                    progress_updates.append((40, "Resampling completed successfully"))
+                    yield ("progress", 40, "Resampling completed successfully")
                 except Exception as e:
-                    return False, f"Failed to resample audio: {str(e)}", []
+                    yield ("done", False, f"Failed to resample audio: {str(e)}", None)
+                    return
+            
+            # Validate audio levels, computing the peak once for validation and normalization
+            peak_val = waveform.abs().max().item()
+            if peak_val < 0.01:
+                yield ("done", False, "Audio level too low. Please provide louder audio.", None)
+                return
+            elif peak_val > 1.0:
+                yield ("progress", 45, "Audio levels high, will normalize...")
             
-            # Normalize audio
-            progress_updates.append((50, "Normalizing audio..."))
-            waveform = waveform / waveform.abs().max()
+            # Normalize audio in place
+            yield ("progress", 50, "Normalizing audio...")
+            waveform.mul_(1.0 / peak_val)
             
             # Trim silence using a more robust method
-            progress_updates.append((60, "Trimming silence..."))
+            yield ("progress", 60, "Trimming silence...")
             try:
-                # Convert to numpy for more reliable silence detection
-                audio_np = waveform.numpy()
-                
-                # Calculate RMS energy
+                # Calculate RMS energy over overlapping frames, using a zero-copy strided view
                 frame_length = 1024
                 hop_length = 512
-                rms = np.sqrt(np.mean(np.square(
-                    audio_np.reshape(-1, frame_length)), 
-                    axis=1
-                ))
+                frames = waveform[0].unfold(-1, frame_length, hop_length)
+                rms = frames.pow(2).mean(dim=-1).sqrt()
                 
                 # Find non-silent parts
-                threshold = 0.01 * np.max(rms)
-                non_silent_frames = rms > threshold
+                non_silent_frames = (rms > 0.01 * rms.max()).nonzero()
+                num_samples = waveform.shape[1]
                 
-                if np.any(non_silent_frames):
-                    # Find first and last non-silent frame
-                    first_frame = np.argmax(non_silent_frames)
-                    last_frame = len(non_silent_frames) - np.argmax(non_silent_frames[::-1]) - 1
-                    
-                    # Convert frame indices to sample indices
-                    start_sample = first_frame * hop_length
-                    end_sample = min((last_frame + 1) * hop_length, audio_np.shape[1])
+                if non_silent_frames.numel():
+                    # Convert first and last non-silent frame indices to sample indices. Frames overlap, so the
+                    # last one ends a full frame (not a hop) after it starts
+                    start_sample = int(non_silent_frames[0, 0]) * hop_length
+                    end_sample = min(int(non_silent_frames[-1, 0]) * hop_length + frame_length, num_samples)
                     
                     # Trim the waveform
-                    waveform = torch.from_numpy(
-                        audio_np[:, start_sample:end_sample]
-                    ).to(waveform.device)
+                    waveform = waveform[:, start_sample:end_sample]
                     
-                    progress_updates.append((65, f"Trimmed {(start_sample/audio_np.shape[1]*100):.1f}% from start, {((audio_np.shape[1]-end_sample)/audio_np.shape[1]*100):.1f}% from end"))
+                    yield ("progress", 65, f"Trimmed {(start_sample/num_samples*100):.1f}% from start, {((num_samples-end_sample)/num_samples*100):.1f}% from end")
                 else:
-                    progress_updates.append((65, "No non-silent parts found, using full audio"))
+                    yield ("progress", 65, "No non-silent parts found, using full audio")
             except Exception as e:
-                progress_updates.append((60, f"Warning: Silence trimming failed: {str(e)}. Using full audio."))
+                yield ("progress", 60, f"Warning: Silence trimming failed: {str(e)}. Using full audio.")
             
             # Save processed audio
-            progress_updates.append((80, "Saving processed audio..."))
+            yield ("progress", 80, "Saving processed audio...")
             voice_path = self.voices_dir / f"{voice_name}.wav"
             
             # Ensure voices directory exists
@@ -153,53 +210,60 @@ class VoiceManager:
             # Save the audio file
             try:
                 torchaudio.save(voice_path, waveform, 24000)
-                progress_updates.append((85, f"Audio saved to {voice_path.name}"))
+                yield ("progress", 85, f"Audio saved to {voice_path.name}")
             except Exception as e:
-                return False, f"Failed to save audio file: {str(e)}", progress_updates
+                yield ("done", False, f"Failed to save audio file: {str(e)}", None)
+                return
             
             # Verify the saved file
             try:
                 test_load, test_sr = torchaudio.load(voice_path)
                 if test_sr != 24000 or test_load.shape != waveform.shape:
                     raise ValueError("Saved audio file verification failed")
-                progress_updates.append((87, "Verified saved audio file"))
+                yield ("progress", 87, "Verified saved audio file")
             except Exception as e:
                 # Clean up failed file
                 if voice_path.exists():
                     voice_path.unlink()
-                return False, f"Audio file verification failed: {str(e)}", progress_updates
+                yield ("done", False, f"Audio file verification failed: {str(e)}", None)
+                return
             
-            # Calculate audio statistics
+            # Calculate audio statistics; the peak is 1.0 after normalization
+            rms_val = waveform.pow(2).mean().sqrt().item()
             stats = {
                 "duration": duration,
                 "sample_rate": 24000,
                 "channels": waveform.shape[0],
-                "peak_amplitude": float(waveform.abs().max()),
-                "rms_level": float(torch.sqrt(torch.mean(waveform ** 2))),
+                "peak_amplitude": 1.0,
+                "rms_level": rms_val,
             }
             
             # Update voice info
-            progress_updates.append((90, "Updating voice database..."))
+            yield ("progress", 90, "Updating voice database...")
             voice_info = {
                 "name": voice_name,
-                "description": f"Cloned voice from {os.path.basename(file_path)}",
+                # Dropdown label, stored once so the voice lists don't format it on every refresh
+                "label": f"{voice_name} (cloned)",
+                "description": f"Cloned voice from {source_name}",
                 "type": "cloned",
                 "path": str(voice_path),
                 "stats": stats,
                 "created": str(datetime.datetime.now()),
-                "source_file": os.path.basename(file_path)
+                "source_file": source_name
             }
             
             self.voices_info["voices"][voice_name] = voice_info
             
             try:
                 self._save_voices_info()
-                progress_updates.append((95, "Voice database updated"))
+                self._voices_list = None
+                yield ("progress", 95, "Voice database updated")
             except Exception as e:
                 # Clean up on database save failure
                 if voice_path.exists():
                     voice_path.unlink()
-                return False, f"Failed to update voice database: {str(e)}", progress_updates
+                yield ("done", False, f"Failed to update voice database: {str(e)}", None)
+                return
             
             # Success message with stats
             success_msg = (
@@ -211,8 +275,8 @@ class VoiceManager:
                 f"RMS Level: {20 * np.log10(stats['rms_level']):.1f}dB"
             )
             
-            progress_updates.append((100, "Voice processing complete!"))
-            return True, success_msg, progress_updates
+            yield ("progress", 100, "Voice processing complete!")
+            yield ("done", True, success_msg, str(voice_path))
             
         except Exception as e:
             # Clean up any partial files
@@ -220,31 +284,29 @@ class VoiceManager:
                 voice_path.unlink()
             
             error_msg = f"Unexpected error: {str(e)}"
-            progress_updates.append((0, error_msg))
-            return False, error_msg, progress_updates
+            yield ("progress", 0, error_msg)
+            yield ("done", False, error_msg, None)
 
-    def get_available_voices(self) -> List[Dict]:
-        """Get list of available voices."""
-        voices = []
-        
-        # Always include default voice first
-        if "default" in self.voices_info["voices"]:
-            voices.append({
-                "id": "default",
-                "name": self.voices_info["voices"]["default"]["name"],
-                "type": "default"
-            })
-        
-        # Add other voices
-        for vid, info in self.voices_info["voices"].items():
-            if vid != "default":
-                voices.append({
-                    "id": vid,
-                    "name": info["name"],
-                    "type": info["type"]
-                })
+    def get_available_voices(self) -> Tuple[Dict, ...]:
+        """Get list of available voices, with the default voice first."""
+        if self._voices_list is not None:
+            return self._voices_list
         
-        return voices
+        items = sorted(
+            self.voices_info["voices"].items(),
+            key=lambda item: (item[0] != "default", item[1]["name"])
+        )
+        # Voices saved before labels were stored get theirs formatted here
+        self._voices_list = tuple(
+            {
+                "id": vid,
+                "name": info["name"],
+                "type": info["type"],
+                "label": info.get("label") or f"{info['name']} ({info['type']})"
+            }
+            for vid, info in items
+        )
+        return self._voices_list
 
     def get_voice_path(self, voice_id: str) -> Optional[str]:
         """Get the path to a voice's audio file."""
@@ -268,12 +330,31 @@ class VoiceManager:
                     os.remove(voice_path)
                 except:
                     pass
+                # Delete the cached voice embedding alongside it
+                try:
+                    os.remove(voice_path + ".emb.pt")
+                except OSError:
+                    pass
             
             # Remove from info
             del self.voices_info["voices"][voice_id]
             self._save_voices_info()
+            self._voices_list = None
             
             return True, "Voice deleted successfully"
             
         except Exception as e:
-            return False, f"Error deleting voice: {str(e)}"
\ No newline at end of file
+            return False, f"Error deleting voice: {str(e)}"
+
+# Shared voice manager so every tab and request sees the same voice library
+_VOICE_MANAGER_SINGLETON: Optional[VoiceManager] = None
+_VOICE_MANAGER_LOCK = threading.Lock()
+
+def get_voice_manager() -> VoiceManager:
+    """Get the shared voice manager, creating it on first use."""
+    global _VOICE_MANAGER_SINGLETON
+    if _VOICE_MANAGER_SINGLETON is None:
+        with _VOICE_MANAGER_LOCK:
+            if _VOICE_MANAGER_SINGLETON is None:
+                _VOICE_MANAGER_SINGLETON = VoiceManager()
+    return _VOICE_MANAGER_SINGLETON
\ No newline at end of file
@@ -1,12 +1,161 @@
-import os
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
-from typing import Tuple, Dict
+import numpy as np
+import torchaudio
+from typing import Dict, Iterator, Optional, Tuple
 
-from voice_manager import VoiceManager
+from voice_manager import VoiceManager, get_voice_manager
+
+# Static component updates reused across yields; gr.update avoids rendering new components
+_BTN_ON = gr.update(interactive=True)
+_BTN_OFF = gr.update(interactive=False)
+_AUDIO_HIDDEN = gr.update(visible=False)
+# Leaves a component as it is, so unchanged components aren't re-sent to the client
+_SKIP = gr.skip()
+
+# Minimum seconds between progress updates sent to the UI
+_PROGRESS_INTERVAL = 0.1
+
+# Number of decoded voice previews kept in memory
+_PREVIEW_CACHE_SIZE = 8
+
+# Number of voices from the top of the dropdown whose previews are decoded ahead of time
+_PREFETCH_COUNT = 4
+
+# Workers that run voice processing off the Gradio handler threads
+_voice_pool = ThreadPoolExecutor(max_workers=2)
+# Separate worker for preview prefetching, so it never queues ahead of a user's voice creation
+_prefetch_pool = ThreadPoolExecutor(max_workers=1)
+
+def _pump_events(events, event_queue: queue.Queue):
+    """Run an event generator to completion, forwarding each event and then a None sentinel to a queue."""
+    try:
+        for event in events:
+            event_queue.put(event)
+    finally:
+        event_queue.put(None)
+
+def _run_on_pool(events) -> Iterator[Tuple]:
+    """Run an event generator on the voice worker pool, yielding its events as they arrive."""
+    event_queue = queue.Queue()
+    future = _voice_pool.submit(_pump_events, events, event_queue)
+    while True:
+        try:
+            event = event_queue.get(timeout=1.0)
+        except queue.Empty:
+            if future.done() and event_queue.empty():
+                return
+            continue
+        if event is None:
+            return
+        yield event
+
+class _VoiceLibraryCache:
+    """Voice list, voice file paths and decoded previews shared by the voice tab's handlers."""
+
+    def __init__(self, voice_manager: VoiceManager):
+        """Cache lookups against voice_manager's library."""
+        self.voice_manager = voice_manager
+        
+        # Voice list and dropdown choices, rebuilt only after a voice is created or deleted
+        self._voices: Tuple[Dict, ...] = ()
+        self._choices = []
+        self._stale = True
+        self._voices_lock = threading.Lock()
+        
+        # Voice file paths looked up so far, dropped when a voice is deleted
+        self._paths: Dict[str, str] = {}
+        
+        # Decoded preview audio of the most recently previewed voices, oldest first.
+        # Guarded by a lock, since prefetch workers fill it alongside the handlers
+        self._previews: "OrderedDict[str, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._previews_lock = threading.Lock()
+
+    def voices(self) -> Tuple[Dict, ...]:
+        """Get available voices, re-reading them only after the list was invalidated."""
+        with self._voices_lock:
+            if self._stale:
+                self._voices = self.voice_manager.get_available_voices()
+                # Dropdown choices are built once per change rather than on every refresh, as (label, value) pairs
+                self._choices = [(v["label"], v["id"]) for v in self._voices]
+                self._stale = False
+            return self._voices
+
+    def choices(self) -> list:
+        """Get the voices dropdown choices, rebuilding them if the voice list changed."""
+        self.voices()
+        with self._voices_lock:
+            return self._choices
+
+    def invalidate(self):
+        """Rebuild the voice list on its next read."""
+        with self._voices_lock:
+            self._stale = True
+
+    def path(self, voice_id: str) -> Optional[str]:
+        """Get the path to a voice's audio file, remembering it for later lookups."""
+        path = self._paths.get(voice_id)
+        if path is None:
+            path = self.voice_manager.get_voice_path(voice_id)
+            if path:
+                self._paths[voice_id] = path
+        return path
+
+    def remember_path(self, voice_id: str, path: str):
+        """Remember the path of a newly created voice."""
+        self._paths[voice_id] = path
+
+    def forget(self, voice_id: str):
+        """Drop everything cached for a deleted voice."""
+        self._paths.pop(voice_id, None)
+        with self._previews_lock:
+            self._previews.pop(voice_id, None)
+
+    def preview(self, voice_id: str) -> Optional[Tuple[int, np.ndarray]]:
+        """Get a voice's preview audio, decoding the file only if it isn't cached."""
+        with self._previews_lock:
+            preview = self._previews.get(voice_id)
+            if preview is not None:
+                self._previews.move_to_end(voice_id)
+                return preview
+        
+        path = self.path(voice_id)
+        if not path:
+            return None
+        
+        # Voices are saved as mono, so the first channel is the whole clip
+        waveform, sample_rate = torchaudio.load(path)
+        preview = (sample_rate, waveform[0].numpy())
+        with self._previews_lock:
+            self._previews[voice_id] = preview
+            if len(self._previews) > _PREVIEW_CACHE_SIZE:
+                self._previews.popitem(last=False)
+        return preview
+
+    def _prefetch(self, voice_id: str):
+        """Decode a voice's preview into the cache in the background."""
+        try:
+            self.preview(voice_id)
+        except Exception as e:
+            print(f"Error prefetching voice preview: {str(e)}")
+
+    def prefetch_top_voices(self):
+        """Start decoding previews for the first voices in the dropdown that aren't cached yet."""
+        # Taken from the dropdown's own (label, value) choices, so only voices the user can see are warmed
+        for _, voice_id in self.choices()[:_PREFETCH_COUNT]:
+            with self._previews_lock:
+                cached = voice_id in self._previews
+            if not cached:
+                _prefetch_pool.submit(self._prefetch, voice_id)
 
 def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
     """Create the voice management tab UI."""
-    voice_manager = VoiceManager()
+    voice_manager = get_voice_manager()
+    cache = _VoiceLibraryCache(voice_manager)
     
     with gr.Tab("Voice Management") as tab:
         gr.Markdown("""
@@ -27,8 +176,7 @@ def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
                 )
                 audio_file = gr.Audio(
                     label="Voice Sample",
-                    type="filepath",
-                    format="wav"
+                    type="numpy"
                 )
                 with gr.Column():
                     create_btn = gr.Button("Create Voice", variant="primary", interactive=True)
@@ -71,12 +219,13 @@ def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
                 gr.Markdown("### Manage Voices")
                 voices_list = gr.Dropdown(
                     label="Select Voice",
-                    choices=[],
+                    choices=cache.choices(),
                     interactive=True,
                     value=None
                 )
                 preview_audio = gr.Audio(
                     label="Voice Preview",
+                    type="numpy",
                     interactive=False
                 )
                 delete_btn = gr.Button("Delete Voice", variant="secondary")
@@ -85,127 +234,107 @@ def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
                     interactive=False
                 )
         
-        def update_voices_list():
-            """Update the list of available voices."""
-            voices = voice_manager.get_available_voices()
+        def _build_dropdown_update():
+            """Build an update refreshing the voices dropdown choices."""
+            choices = cache.choices()
+            cache.prefetch_top_voices()
+            return gr.update(choices=choices, value=None)
+        
+        def _upd(output: str, status: str, progress: int, btn: dict, audio=_AUDIO_HIDDEN) -> dict:
+            """Build a create_voice UI update."""
             return {
-                voices_list: gr.Dropdown(
-                    choices=[{"value": v["id"], "label": f"{v['name']} ({v['type']})"} for v in voices],
-                    value=None
-                )
+                create_output: output,
+                create_status: status,
+                create_progress: progress,
+                create_btn: btn,
+                processed_audio: audio
             }
         
-        def create_voice(name: str, file_path: str) -> dict:
+        def create_voice(name: str, audio: Optional[Tuple[int, np.ndarray]]) -> Iterator[dict]:
             """Handle voice creation."""
             try:
                 # Input validation
-                if not name or not name.strip():
-                    return {
-                        create_output: "Please enter a voice name",
-                        create_status: "Error",
-                        create_progress: 0,
-                        create_btn: gr.Button(interactive=True),
-                        processed_audio: gr.Audio(visible=False)
-                    }
-                if not file_path:
-                    return {
-                        create_output: "Please upload an audio file",
-                        create_status: "Error",
-                        create_progress: 0,
-                        create_btn: gr.Button(interactive=True),
-                        processed_audio: gr.Audio(visible=False)
-                    }
-                
-                name = name.strip()
+                name = (name or "").strip()
+                if not name:
+                    yield _upd("Please enter a voice name", "Error", 0, _BTN_ON)
+                    return
+                if audio is None:
+                    yield _upd("Please upload an audio file", "Error", 0, _BTN_ON)
+                    return
                 
                 # Disable button during processing
-                yield {
-                    create_output: "Starting voice creation process...",
-                    create_status: "Processing",
-                    create_progress: 0,
-                    create_btn: gr.Button(interactive=False),
-                    processed_audio: gr.Audio(visible=False)
-                }
+                yield _upd("Starting voice creation process...", "Processing", 0, _BTN_OFF)
                 
-                # Process the voice
-                success, message, progress_updates = voice_manager.process_audio_file(file_path, name)
+                # Track the last 5 status messages
+                status_history = deque(maxlen=5)
+                success, message, voice_path = False, "Voice processing did not complete", None
+                last_yield_t = 0.0
+                last_stage = None
                 
-                # Track accumulated status messages
-                status_history = []
-                
-                # Update progress
-                for progress, status in progress_updates:
+                # Process the voice on the worker pool, updating progress as each stage reports in
+                for event in _run_on_pool(voice_manager.process_audio_array(*audio, name)):
+                    if event[0] == "done":
+                        _, success, message, voice_path = event
+                        continue
+                    
+                    _, progress, status = event
                     status_history.append(status)
-                    # Keep only the last 5 status messages
-                    display_status = "\n".join(status_history[-5:])
+                    stage = "Processing" if progress < 100 else "Complete"
                     
-                    yield {
-                        create_output: display_status,
-                        create_status: "Processing" if progress < 100 else "Complete",
-                        create_progress: progress,
-                        create_btn: gr.Button(interactive=False),
-                        processed_audio: gr.Audio(visible=False)
-                    }
+                    # Throttle updates to the UI, but never skip the first, last or a stage change
+                    now = time.monotonic()
+                    if now - last_yield_t < _PROGRESS_INTERVAL and progress not in (0, 100) and stage == last_stage:
+                        continue
+                    last_yield_t = now
+                    last_stage = stage
+                    
+                    # The button and preview don't change mid-processing, so only send the progress
+                    yield _upd("\n".join(status_history), stage, progress, _SKIP, _SKIP)
                 
                 if success:
-                    # Update UI
-                    update_voices_list()
+                    # Rebuild the voice list with the new voice
+                    cache.invalidate()
                     
-                    # Show processed audio preview
-                    voice_path = voice_manager.get_voice_path(name)
+                    # Show processed audio preview, using the path reported by the voice manager
                     if voice_path:
-                        yield {
-                            create_output: message,
-                            create_status: "Complete",
-                            create_progress: 100,
-                            create_btn: gr.Button(interactive=True),
-                            processed_audio: gr.Audio(value=voice_path, visible=True)
-                        }
+                        cache.remember_path(name, voice_path)
+                        update = _upd(message, "Complete", 100, _BTN_ON, gr.update(value=voice_path, visible=True))
                     else:
-                        yield {
-                            create_output: message,
-                            create_status: "Complete",
-                            create_progress: 100,
-                            create_btn: gr.Button(interactive=True),
-                            processed_audio: gr.Audio(visible=False)
-                        }
+                        update = _upd(message, "Complete", 100, _BTN_ON)
+                    update[voices_list] = _build_dropdown_update()
+                    yield update
                 else:
-                    yield {
-                        create_output: message,
-                        create_status: "Error",
-                        create_progress: 0,
-                        create_btn: gr.Button(interactive=True),
-                        processed_audio: gr.Audio(visible=False)
-                    }
+                    yield _upd(message, "Error", 0, _BTN_ON)
                     
             except Exception as e:
-                yield {
-                    create_output: f"Unexpected error: {str(e)}",
-                    create_status: "Error",
-                    create_progress: 0,
-                    create_btn: gr.Button(interactive=True),
-                    processed_audio: gr.Audio(visible=False)
-                }
+                yield _upd(f"Unexpected error: {str(e)}", "Error", 0, _BTN_ON)
         
         def load_voice_preview(voice_id: str):
             """Load voice preview audio."""
             if not voice_id:
                 return None
-            path = voice_manager.get_voice_path(voice_id)
-            return path if path else None
+            return cache.preview(voice_id)
         
-        def delete_voice(voice_id: str) -> str:
+        def delete_voice(voice_id: str) -> tuple:
             """Handle voice deletion."""
             if not voice_id:
-                return "Please select a voice to delete"
+                return "Please select a voice to delete", gr.update()
             
             success, message = voice_manager.delete_voice(voice_id)
             if success:
-                # Update UI
-                update_voices_list()
-            return message
+                # Refresh the dropdown so the deleted voice disappears
+                cache.invalidate()
+                cache.forget(voice_id)
+                return message, _build_dropdown_update()
+            return message, gr.update()
+        
+        def refresh_voices_list():
+            """Refresh the voices dropdown with voices created or deleted in other sessions."""
+            return gr.update(choices=cache.choices())
         
         # Wire up event handlers
+        tab.select(fn=refresh_voices_list, outputs=[voices_list])
+        
         create_btn.click(
             fn=create_voice,
             inputs=[voice_name, audio_file],
@@ -214,7 +343,8 @@ def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
                 create_status,
                 create_progress,
                 create_btn,
-                processed_audio
+                processed_audio,
+                voices_list
             ],
             show_progress=True
         )
@@ -225,10 +355,13 @@ def create_voice_tab() -> Tuple[gr.Tab, VoiceManager]:
             outputs=[preview_audio]
         )
         
+        # Warm the preview cache as soon as the user opens the dropdown
+        voices_list.focus(fn=cache.prefetch_top_voices)
+        
         delete_btn.click(
             fn=delete_voice,
             inputs=[voices_list],
-            outputs=[manage_output]
+            outputs=[manage_output, voices_list]
         )
         
     return tab, voice_manager
\ No newline at end of file
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import generate_podcast
+from generate_podcast import stream_podcast_script
+from llm_cache import LLMCache
+
+ARGS = ("RHEL", "qwen2.5:32b", "Lily", "Marshall")
+
+
+class _FakeResponse:
+    def __init__(self, chunks, status_code=200):
+        self.status_code = status_code
+        self.chunks = chunks
+
+    def iter_lines(self):
+        for chunk in self.chunks:
+            yield json.dumps(chunk).encode()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LLMCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr(generate_podcast, "llm_cache", cache)
+    return cache
+
+
+def _reply(monkeypatch, *chunks):
+    monkeypatch.setattr(generate_podcast._SESSION, "post", lambda *args, **kwargs: _FakeResponse(list(chunks)))
+
+
+def _cached(cache):
+    return cache.get(cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL"))
+
+
+def test_streamed_script_is_cached_when_done(cache, monkeypatch):
+    _reply(monkeypatch, {"response": "<|Lily|>: Hello"}, {"response": "!", "done": True})
+
+    assert list(stream_podcast_script(*ARGS)) == ["<|Lily|>: Hello", "<|Lily|>: Hello!"]
+    assert _cached(cache) == "<|Lily|>: Hello!"
+
+
+def test_error_line_replaces_the_script(cache, monkeypatch):
+    _reply(monkeypatch, {"response": "<|Lily|>: Hel"}, {"error": "model crashed"})
+
+    assert list(stream_podcast_script(*ARGS)) == ["<|Lily|>: Hel", "Error: model crashed"]
+    assert _cached(cache) is None
+
+
+def test_unfinished_stream_is_not_cached(cache, monkeypatch):
+    _reply(monkeypatch, {"response": "<|Lily|>: Hel"})
+
+    assert list(stream_podcast_script(*ARGS)) == ["<|Lily|>: Hel"]
+    assert _cached(cache) is None
+
+
+def test_empty_reply_is_not_cached(cache, monkeypatch):
+    _reply(monkeypatch, {"response": "  ", "done": True})
+
+    list(stream_podcast_script(*ARGS))
+
+    assert _cached(cache) is None
+
+
+def test_cached_script_is_returned_without_a_request(cache, monkeypatch):
+    cache.set(cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL"), "<|Lily|>: Cached!")
+    monkeypatch.setattr(generate_podcast._SESSION, "post", lambda *args, **kwargs: pytest.fail("Ollama was called"))
+
+    assert list(stream_podcast_script(*ARGS)) == ["<|Lily|>: Cached!"]
+
+
+def test_bypass_replaces_the_cached_script(cache, monkeypatch):
+    cache.set(cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL"), "<|Lily|>: Cached!")
+    _reply(monkeypatch, {"response": "<|Lily|>: Fresh!", "done": True})
+
+    assert list(stream_podcast_script(*ARGS, bypass=True)) == ["<|Lily|>: Fresh!"]
+    assert _cached(cache) == "<|Lily|>: Fresh!"
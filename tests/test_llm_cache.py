@@ -0,0 +1,56 @@
+from llm_cache import LLMCache
+
+
+def test_get_returns_cached_response(tmp_path):
+    cache = LLMCache(cache_dir=str(tmp_path))
+    key = cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL")
+
+    cache.set(key, "<|Lily|>: Hello!")
+
+    assert cache.get(key) == "<|Lily|>: Hello!"
+
+
+def test_get_missing_key_returns_none(tmp_path):
+    cache = LLMCache(cache_dir=str(tmp_path))
+
+    assert cache.get(cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL")) is None
+
+
+def test_make_key_depends_on_every_input():
+    keys = {
+        LLMCache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL"),
+        LLMCache.make_key("llama3:8b", "Lily", "Marshall", "RHEL"),
+        LLMCache.make_key("qwen2.5:32b", "Marshall", "Lily", "RHEL"),
+        LLMCache.make_key("qwen2.5:32b", "Lily", "Marshall", "OpenShift"),
+    }
+
+    assert len(keys) == 4
+    assert LLMCache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL") in keys
+
+
+def test_expired_entry_is_removed(tmp_path):
+    cache = LLMCache(cache_dir=str(tmp_path), expire=-1)
+    key = cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL")
+    cache.set(key, "stale")
+
+    assert cache.get(key) is None
+    assert not (tmp_path / f"{key}.json").exists()
+
+
+def test_set_replaces_entry_without_leaving_temporary_files(tmp_path):
+    cache = LLMCache(cache_dir=str(tmp_path))
+    key = cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL")
+
+    cache.set(key, "first")
+    cache.set(key, "second")
+
+    assert cache.get(key) == "second"
+    assert [path.name for path in tmp_path.iterdir()] == [f"{key}.json"]
+
+
+def test_corrupt_entry_returns_none(tmp_path):
+    cache = LLMCache(cache_dir=str(tmp_path))
+    key = cache.make_key("qwen2.5:32b", "Lily", "Marshall", "RHEL")
+    (tmp_path / f"{key}.json").write_text('{"expires": ')
+
+    assert cache.get(key) is None
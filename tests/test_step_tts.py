@@ -0,0 +1,73 @@
+from step_tts import TTS_BATCH_SIZE, _batch_turns, _parse_turns
+
+
+def test_batch_turns_groups_by_voice():
+    turns = [("Lily", "Hello there."), ("Marshall", "Hi, Lily."), ("Lily", "Welcome back."), ("Marshall", "Thanks!!!")]
+    host_voices = {"Lily": "default", "Marshall": "marshall"}
+
+    batches = _batch_turns(turns, host_voices)
+
+    assert [voice_id for voice_id, _ in batches] == ["default", "marshall"]
+    assert sorted(batches[0][1]) == [0, 2]
+    assert sorted(batches[1][1]) == [1, 3]
+
+
+def test_batch_turns_orders_batches_by_earliest_turn():
+    turns = [("Marshall", "Short."), ("Lily", "Short."), ("Marshall", "A much, much longer turn.")]
+    host_voices = {"Lily": "default", "Marshall": "marshall"}
+
+    batches = _batch_turns(turns, host_voices)
+
+    assert [min(indices) for _, indices in batches] == sorted(min(indices) for _, indices in batches)
+    assert batches[0] == ("marshall", [0])
+
+
+def test_batch_turns_splits_on_text_length():
+    turns = [("Lily", "x" * 100), ("Lily", "x" * 110), ("Lily", "x" * 200)]
+
+    batches = _batch_turns(turns, {"Lily": "default"})
+
+    assert batches == [("default", [0, 1]), ("default", [2])]
+
+
+def test_batch_turns_caps_batch_size():
+    turns = [("Lily", "Same length.")] * (TTS_BATCH_SIZE + 4)
+
+    batches = _batch_turns(turns, {"Lily": "default"})
+
+    assert [len(indices) for _, indices in batches] == [TTS_BATCH_SIZE, 4]
+    assert sorted(i for _, indices in batches for i in indices) == list(range(len(turns)))
+
+
+def test_batch_turns_shares_batches_between_speakers_with_the_same_voice():
+    turns = [("Lily", "Hello there."), ("Marshall", "Hello again.")]
+
+    batches = _batch_turns(turns, {"Lily": "default", "Marshall": "default"})
+
+    assert batches == [("default", [0, 1])]
+
+
+def test_parse_turns_reads_speaker_and_content():
+    script = "<|Lily|>: Welcome to the show!\n\n<|Marshall|>: Glad to be here."
+
+    assert _parse_turns(script) == [("Lily", "Welcome to the show!"), ("Marshall", "Glad to be here.")]
+
+
+def test_parse_turns_keeps_line_breaks_within_a_turn():
+    script = "<|Lily|>: First line.\nSecond line.\n\n<|Marshall|>: Reply."
+
+    assert _parse_turns(script) == [("Lily", "First line.\nSecond line."), ("Marshall", "Reply.")]
+
+
+def test_parse_turns_ignores_text_outside_turns():
+    script = "Here is your podcast:\n\n<|Lily|>: Hello!\n\n<|Marshall|>: Goodbye!\n\nI hope you enjoyed it."
+
+    assert _parse_turns(script) == [("Lily", "Hello!"), ("Marshall", "Goodbye!")]
+
+
+def test_parse_turns_allows_spaces_in_speaker_names():
+    assert _parse_turns("<|Lily Aldrin|>:   Hi!") == [("Lily Aldrin", "Hi!")]
+
+
+def test_parse_turns_without_dialogue_is_empty():
+    assert _parse_turns("Sorry, I can't write that podcast.") == []
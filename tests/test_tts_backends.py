@@ -0,0 +1,96 @@
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel, LogitsProcessorList
+
+from tts_backends import VOCODER_CHUNK_TOKENS, VOCODER_OVERLAP_TOKENS, _ChunkVocoder, _crossfade
+
+SAMPLES_PER_TOKEN = 4
+
+
+class _TinyTTSModel(GPT2LMHeadModel):
+    vocoded = None
+
+    def vocoder(self, tokens, voice_embedding=None):
+        if self.vocoded is not None:
+            self.vocoded.append(tokens.clone())
+        # Each token becomes SAMPLES_PER_TOKEN samples holding its id, so audio can be traced back to tokens
+        return tokens.float().repeat_interleave(SAMPLES_PER_TOKEN, dim=1)
+
+
+def _tiny_model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=32, n_positions=256, n_embd=16, n_layer=1, n_head=2, eos_token_id=30, pad_token_id=31)
+    return _TinyTTSModel(config).eval()
+
+
+def _expected_audio(tokens):
+    return tokens.float().repeat_interleave(SAMPLES_PER_TOKEN)
+
+
+def test_chunks_are_vocoded_during_generate():
+    model = _tiny_model()
+    input_ids = torch.randint(0, 30, (2, 5))
+    new_tokens = 2 * VOCODER_CHUNK_TOKENS + 7
+    vocoder = _ChunkVocoder(model, input_ids.shape[1], None, None)
+
+    sequences = model.generate(
+        input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        do_sample=False,
+        max_new_tokens=new_tokens,
+        min_new_tokens=new_tokens,
+        logits_processor=LogitsProcessorList([vocoder])
+    )
+
+    # Both full chunks were vocoded while generate() was running
+    assert len(vocoder.chunks) == 2
+
+    audio = vocoder.finish(sequences)
+
+    assert len(vocoder.chunks) == 3
+    for row, row_audio in zip(sequences, audio):
+        assert torch.allclose(row_audio, _expected_audio(row[input_ids.shape[1]:]))
+
+
+def test_padding_after_a_row_finishes_is_trimmed():
+    model = _tiny_model()
+    prompt_length, new_tokens, finished_after = 3, VOCODER_CHUNK_TOKENS + 10, 12
+    sequences = torch.randint(1, 30, (2, prompt_length + new_tokens))
+    sequences[1, prompt_length + finished_after:] = 0
+    vocoder = _ChunkVocoder(model, prompt_length, None, pad_token_id=0)
+
+    # Replay the calls generate() makes before sampling each new token
+    for length in range(prompt_length, prompt_length + new_tokens):
+        vocoder(sequences[:, :length], torch.zeros(2, 32))
+    audio = vocoder.finish(sequences)
+
+    assert torch.allclose(audio[0], _expected_audio(sequences[0, prompt_length:]))
+    assert torch.allclose(audio[1], _expected_audio(sequences[1, prompt_length:prompt_length + finished_after]))
+
+
+def test_finish_without_generated_tokens_raises():
+    vocoder = _ChunkVocoder(_tiny_model(), 4, None, None)
+
+    with pytest.raises(ValueError):
+        vocoder.finish(torch.ones(1, 4, dtype=torch.long))
+
+
+def test_chunks_are_vocoded_with_the_previous_chunks_last_tokens():
+    model = _tiny_model()
+    model.vocoded = []
+    prompt_length = 3
+    sequences = torch.randint(1, 30, (1, prompt_length + VOCODER_CHUNK_TOKENS + 10))
+    vocoder = _ChunkVocoder(model, prompt_length, None, None)
+
+    vocoder(sequences[:, :prompt_length + VOCODER_CHUNK_TOKENS], torch.zeros(1, 32))
+    vocoder.finish(sequences)
+
+    first, second = model.vocoded
+    assert torch.equal(first, sequences[:, prompt_length:prompt_length + VOCODER_CHUNK_TOKENS])
+    assert torch.equal(second, sequences[:, prompt_length + VOCODER_CHUNK_TOKENS - VOCODER_OVERLAP_TOKENS:])
+
+
+def test_crossfade_blends_the_overlap():
+    audio = _crossfade(torch.zeros(6), torch.ones(6), 3)
+
+    assert torch.equal(audio, torch.tensor([0, 0, 0, 0, 0.5, 1, 1, 1, 1]))
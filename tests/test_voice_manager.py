@@ -0,0 +1,91 @@
+import numpy as np
+import torch
+
+import voice_manager as voice_manager_module
+from voice_manager import VoiceManager
+
+
+def test_array_to_waveform_scales_int16_to_unit_range():
+    audio = np.array([0, 16384, -32768], dtype=np.int16)
+
+    waveform = VoiceManager._array_to_waveform(audio)
+
+    assert waveform.dtype == torch.float32
+    assert waveform.shape == (1, 3)
+    assert torch.equal(waveform, torch.tensor([[0.0, 0.5, -1.0]]))
+
+
+def test_array_to_waveform_scales_int32_to_unit_range():
+    audio = np.array([2 ** 30, -2 ** 31], dtype=np.int32)
+
+    waveform = VoiceManager._array_to_waveform(audio)
+
+    assert torch.equal(waveform, torch.tensor([[0.5, -1.0]]))
+
+
+def test_array_to_waveform_keeps_float_samples():
+    audio = np.array([0.25, -0.5], dtype=np.float64)
+
+    waveform = VoiceManager._array_to_waveform(audio)
+
+    assert waveform.dtype == torch.float32
+    assert torch.equal(waveform, torch.tensor([[0.25, -0.5]]))
+
+
+def test_array_to_waveform_puts_channels_first():
+    audio = np.array([[0.1, -0.1], [0.2, -0.2], [0.3, -0.3]], dtype=np.float32)
+
+    waveform = VoiceManager._array_to_waveform(audio)
+
+    assert waveform.shape == (2, 3)
+    assert waveform.is_contiguous()
+    assert torch.equal(waveform, torch.from_numpy(audio.T.copy()))
+
+
+def test_array_to_waveform_does_not_share_memory_with_the_input():
+    audio = np.array([0.25, -0.5], dtype=np.float32)
+
+    VoiceManager._array_to_waveform(audio).mul_(2)
+
+    assert np.array_equal(audio, np.array([0.25, -0.5], dtype=np.float32))
+
+
+def test_available_voices_are_memoized_per_instance(tmp_path):
+    voice_manager = VoiceManager(voices_dir=str(tmp_path / "a"))
+    other_manager = VoiceManager(voices_dir=str(tmp_path / "b"))
+
+    voices = voice_manager.get_available_voices()
+
+    assert isinstance(voices, tuple)
+    assert voice_manager.get_available_voices() is voices
+    assert other_manager.get_available_voices() is not voices
+
+
+def test_deleting_a_voice_refreshes_available_voices(tmp_path):
+    voice_manager = VoiceManager(voices_dir=str(tmp_path))
+    voice_path = tmp_path / "lily.wav"
+    voice_path.write_bytes(b"")
+    voice_manager.voices_info["voices"]["lily"] = {"name": "lily", "type": "cloned", "path": str(voice_path)}
+    voice_manager._voices_list = None
+    assert [v["id"] for v in voice_manager.get_available_voices()] == ["default", "lily"]
+
+    success, _ = voice_manager.delete_voice("lily")
+
+    assert success
+    assert [v["id"] for v in voice_manager.get_available_voices()] == ["default"]
+    assert not voice_path.exists()
+
+
+def test_silence_trimming_keeps_the_whole_last_voiced_frame(tmp_path, monkeypatch):
+    saved = {}
+    monkeypatch.setattr(voice_manager_module.torchaudio, "save", lambda path, waveform, sample_rate: saved.update(waveform=waveform))
+    monkeypatch.setattr(voice_manager_module.torchaudio, "load", lambda path: (saved["waveform"], 24000))
+    voice_manager = VoiceManager(voices_dir=str(tmp_path))
+    audio = np.zeros(24000 * 6, dtype=np.float32)
+    audio[:130000] = 0.5
+
+    *_, done = voice_manager.process_audio_array(24000, audio, "lily")
+
+    assert done[:2] == ("done", True)
+    # The last frame with speech starts at sample 253 * 512 and is 1024 samples long
+    assert saved["waveform"].shape[1] == 253 * 512 + 1024